@@ -34,7 +34,6 @@ import threading
 import traceback
 import bgapi
 from bgapi.connector import ConnectorException
-import serial.tools.list_ports
 from .status import Status
 
 LOG_FORMAT_SINGLE = "%(asctime)s: %(levelname)s - %(message)s"
@@ -59,13 +58,19 @@ bgapi.bglib.CommandFailedError = CommandFailedError
 class GenericApp(threading.Thread):
     """ Generic application class. """
     _id = itertools.count(0)
+    # Instances may be created from several threads and the atomicity of
+    # next() on the counter relies on the GIL.
+    _id_lock = threading.Lock()
     def __init__(self, connector, apis):
-        self.id = next(self._id)
+        with self._id_lock:
+            self.id = next(self._id)
         self.lib = bgapi.BGLib(connector, apis)
         self.log = logging.getLogger(f"{type(self).__name__}#{self.id}")
         # Set the ready event in the child classes to feed the watchdog
         self.ready = threading.Event()
         self._run = threading.Event()
+        # Dedicated event callbacks cached by event name
+        self._event_callbacks = {}
         super().__init__()
 
     def event_handler(self, evt):
@@ -89,38 +94,34 @@ class GenericApp(threading.Thread):
         # Start watchdog in the background
         threading.Thread(target=self.watchdog, daemon=True).start()
 
+        # Bind frequently used methods to locals to avoid attribute lookups in the loop.
+        get_event = self.lib.get_event
+        dispatch = self._dispatch
+        is_running = self._run.is_set
+
+        # Wait for events in a blocking manner where possible.
+        # - The stop method puts a None sentinel into the event queue to wake up the loop.
+        # - On POSIX hosts, the KeyboardInterrupt interrupts the blocking wait in the main thread.
+        # - In threaded mode, the KeyboardInterrupt is handled by the main thread, which calls stop.
+        # - On Windows hosts, a blocking wait can't be interrupted by the KeyboardInterrupt.
+        #   Therefore, the main thread polls the queue with a 0.1 s timeout as a tradeoff
+        #   between CPU load and KeyboardInterrupt response time.
+        # See the documentation of Queue.get method for details.
+        if sys.platform == "win32" and threading.current_thread() is threading.main_thread():
+            event_timeout = 0.1
+        else:
+            event_timeout = None
+
         # Enter main program loop.
-        while self._run.is_set():
+        while is_running():
             try:
-                # The timeout is needed to get the KeyboardInterrupt.
-                # On Windows hosts, timeout is needed in both threaded and non-threaded modes.
-                # On POSIX hosts, timeout is needed only in threaded mode.
-                # The timeout value is a tradeoff between CPU load and KeyboardInterrupt response time.
-                # timeout=None: minimal CPU usage, KeyboardInterrupt not recognized until the next event.
-                # timeout=0: maximal CPU usage, KeyboardInterrupt recognized immediately.
-                # See the documentation of Queue.get method for details.
-                evt = self.lib.get_event(timeout=0.1)
-                if evt is None:
-                    continue
-                # Convert event parameters with errorcode datatype into Status objects
-                for param in evt._apinode.params:
-                    if param.datatype.name == "errorcode":
-                        value = getattr(evt, param.name)
-                        setattr(evt, param.name, Status(value))
-                self._event_handler(evt)
-                if not self.ready.is_set():
-                    # Unexpected events may happen if the previous host execution aborted and the
-                    # target device continues emitting events. Therefore, calling application event
-                    # handlers should be prevented before the device is ready.
-                    continue
-                self.event_handler(evt)
-                # Call dedicated event callback if available.
-                event_callback = getattr(self, evt._str, None)
-                if event_callback is not None:
-                    event_callback(evt)
-            except bgapi.bglib.CommandFailedError as err:
-                # Get additional info from trace.
-                trace = traceback.extract_tb(sys.exc_info()[-1])[-3]
+                evt = get_event(timeout=event_timeout)
+                if evt is not None:
+                    dispatch(evt)
+            except CommandFailedError as err:
+                # Get additional info from trace. Only the last 3 entries are extracted,
+                # source lines are not looked up for the rest of the stack.
+                trace = traceback.extract_tb(err.__traceback__, limit=-3)[0]
                 self.log.error("%s", err)
                 self.log.error("  File '%s', line %d, in %s", trace.filename, trace.lineno, trace.name)
                 self.log.error("    %s", trace.line)
@@ -134,9 +135,36 @@ class GenericApp(threading.Thread):
         self.lib.close()
         sys.exit(exit_code)
 
+    def _dispatch(self, evt):
+        """ Pass the event to the internal, the public and the dedicated event handlers. """
+        # Convert event parameters with errorcode datatype into Status objects
+        for param in evt._apinode.params:
+            if param.datatype.name == "errorcode":
+                value = getattr(evt, param.name)
+                setattr(evt, param.name, Status(value))
+        self._event_handler(evt)
+        if not self.ready.is_set():
+            # Unexpected events may happen if the previous host execution aborted and the
+            # target device continues emitting events. Therefore, calling application event
+            # handlers should be prevented before the device is ready.
+            return
+        self.event_handler(evt)
+        # Call dedicated event callback if available.
+        # The event name is a property formatted on every access, evaluate it only once.
+        event_name = evt._str
+        try:
+            event_callback = self._event_callbacks[event_name]
+        except KeyError:
+            # Look up the callback only once for every event type.
+            event_callback = self._event_callbacks[event_name] = getattr(self, event_name, None)
+        if event_callback is not None:
+            event_callback(evt)
+
     def stop(self):
         """ Terminate main execution loop. """
         self._run.clear()
+        # Wake up the main execution loop if it is waiting for events.
+        self.lib.event_queue.put(None)
 
     def reset(self):
         """ Reset device, meant to be overridden by child classes. """
@@ -170,7 +198,7 @@ class BluetoothApp(GenericApp):
             # Feed the watchdog
             self.ready.set()
             # Check Bluetooth stack version
-            version = "{major}.{minor}.{patch}".format(**vars(evt))
+            version = f"{evt.major}.{evt.minor}.{evt.patch}"
             self.log.info("Bluetooth stack booted: v%s-b%s", version, evt.build)
             if version != self.lib.bt.__version__:
                 self.log.warning("BGAPI version mismatch: %s (target) != %s (host)", version, self.lib.bt.__version__)
@@ -195,7 +223,7 @@ class BtMeshApp(GenericApp):
             # Feed the watchdog
             self.ready.set()
             # Check Bluetooth stack version
-            version = "{major}.{minor}.{patch}".format(**vars(evt))
+            version = f"{evt.major}.{evt.minor}.{evt.patch}"
             self.log.info("Bluetooth stack booted: v%s-b%s", version, evt.build)
             if version != self.lib.bt.__version__:
                 self.log.warning("BGAPI version mismatch: %s (target) != %s (host)", version, self.lib.bt.__version__)
@@ -218,32 +246,31 @@ class ArgumentParser(argparse.ArgumentParser):
         if self.single_mode:
             nargs = "?"
             cpc_const = []
-            examples = (
-                "examples:"
-                "\n  %(prog)s                 Try to autodetect serial port"
-                "\n  %(prog)s COM4            Open serial port on Windows"
-                "\n  %(prog)s /dev/ttyACM0    Open serial port on POSIX"
-                "\n  %(prog)s 192.168.1.10    Open TCP port")
+            examples = [
+                "examples:",
+                "  %(prog)s                 Try to autodetect serial port",
+                "  %(prog)s COM4            Open serial port on Windows",
+                "  %(prog)s /dev/ttyACM0    Open serial port on POSIX",
+                "  %(prog)s 192.168.1.10    Open TCP port"]
             if self.cpc_options:
-                examples += "\n  %(prog)s -c              Open default CPC daemon instance"
-                examples += "\n  %(prog)s -c cpcd_1       Open CPC daemon instance"
+                examples.append("  %(prog)s -c              Open default CPC daemon instance")
+                examples.append("  %(prog)s -c cpcd_1       Open CPC daemon instance")
         else:
             nargs = "*"
             cpc_const = None
-            examples = (
-                "examples:"
-                "\n  %(prog)s                                        Try to autodetect all serial ports"
-                "\n  %(prog)s COM4 COM5 COM6 COM7 COM8               Open serial ports on Windows"
-                "\n  %(prog)s /dev/ttyACM0 /dev/ttyACM1              Open serial ports on POSIX"
-                "\n  %(prog)s 192.168.1.10 192.168.1.11              Open TCP ports"
-                "\n  %(prog)s /dev/ttyACM0 192.168.1.10              Open serial port and TCP port")
+            examples = [
+                "examples:",
+                "  %(prog)s                                        Try to autodetect all serial ports",
+                "  %(prog)s COM4 COM5 COM6 COM7 COM8               Open serial ports on Windows",
+                "  %(prog)s /dev/ttyACM0 /dev/ttyACM1              Open serial ports on POSIX",
+                "  %(prog)s 192.168.1.10 192.168.1.11              Open TCP ports",
+                "  %(prog)s /dev/ttyACM0 192.168.1.10              Open serial port and TCP port"]
             if self.cpc_options:
-                examples += "\n  %(prog)s -c cpcd_0 cpcd_1 cpcd_2                Open CPC daemon instances"
-                examples += "\n  %(prog)s /dev/ttyACM0 192.168.1.10 -c cpcd_1    Open serial port, TCP port and CPC daemon instance"
-        if epilog is None:
-            epilog = examples
-        else:
-            epilog = examples + "\n" + epilog
+                examples.append("  %(prog)s -c cpcd_0 cpcd_1 cpcd_2                Open CPC daemon instances")
+                examples.append("  %(prog)s /dev/ttyACM0 192.168.1.10 -c cpcd_1    Open serial port, TCP port and CPC daemon instance")
+        if epilog is not None:
+            examples.append(epilog)
+        epilog = "\n".join(examples)
 
         super().__init__(*args, epilog=epilog, formatter_class=formatter_class, **kwargs)
 
@@ -357,6 +384,8 @@ def get_connector(args=None):
 
 def get_device_list():
     """ Find Segger J-Link devices based on USB vendor ID. """
+    # Import port enumeration only when autodetection is actually needed.
+    import serial.tools.list_ports
     return [com.device for com in serial.tools.list_ports.comports() if com.vid == 0x1366]
 
 def connector_from_str(param):
@@ -365,46 +394,53 @@ def connector_from_str(param):
     This function is optimized for Silicon Labs development boards with default parameters.
     For non-default settings use the SerialConnector and SocketConnector constructors directly.
     """
-    connector_type = bgapi.SocketConnector
-    try:
-        # Check for a valid IPv4 address.
-        socket.inet_aton(param)
-        # Append WSTK serial port number.
-        param = (param, 4901)
-    except OSError:
-        # Assume serial port.
-        connector_type = bgapi.SerialConnector
+    connector_type = bgapi.SerialConnector
+    # Only strings of digits and dots are passed to the IPv4 parser,
+    # serial port names (e.g. COM4, /dev/ttyACM0) never raise an exception.
+    if param.replace(".", "").isdigit():
+        try:
+            # Check for a valid IPv4 address.
+            socket.inet_aton(param)
+            # Append WSTK serial port number.
+            param = (param, 4901)
+            connector_type = bgapi.SocketConnector
+        except OSError:
+            # Assume serial port.
+            pass
     return connector_type(param)
 
 def find_service_in_advertisement(adv_data, uuid):
     """ Find service with the given UUID in the advertising data. """
-    if len(uuid) != 2 and len(uuid) != 16:
+    uuid_length = len(uuid)
+    adv_data_length = len(adv_data)
+    if uuid_length not in (2, 16):
         raise ValueError("Invalid UUID length.")
+    # Most advertisements don't contain the UUID at all, reject them without parsing.
+    if uuid not in adv_data:
+        return False
     # Incomplete List of 16 or 128-bit  Service Class UUIDs.
-    incomplete_list = 0x02 if len(uuid) == 2 else 0x06
+    incomplete_list = 0x02 if uuid_length == 2 else 0x06
     # Complete List of 16 or 128-bit  Service Class UUIDs.
-    complete_list = 0x03 if len(uuid) == 2 else 0x07
+    complete_list = incomplete_list + 1
 
     # Parse advertisement packet.
+    # Every AD structure has at least a length and a type field. A trailing length field without
+    # type indicates malformed advertising data, which is treated as UUID not found.
     i = 0
-    while i < len(adv_data):
-        try:
-            ad_field_length = adv_data[i]
-            ad_field_type = adv_data[i + 1]
-            # Find AD types of interest.
-            if ad_field_type in (incomplete_list, complete_list):
-                ad_uuid_count = int((ad_field_length - 1) / len(uuid))
-                # Compare each UUID to the service UUID to be found.
-                for j in range(ad_uuid_count):
-                    start_idx = i + 2 + j*len(uuid)
-                    # Get UUID from AD data.
-                    ad_uuid = adv_data[start_idx: start_idx + len(uuid)]
-                    if ad_uuid == uuid:
-                        return True
-            # Advance to the next AD structure.
-            i += ad_field_length + 1
-        except IndexError:
-            # Malformed advertising data
-            return False
+    while i + 1 < adv_data_length:
+        ad_field_length = adv_data[i]
+        ad_field_type = adv_data[i + 1]
+        # Find AD types of interest.
+        if ad_field_type in (incomplete_list, complete_list):
+            start_idx = i + 2
+            end_idx = i + 1 + ad_field_length
+            # Search the UUID list at once, accept only matches on UUID boundaries.
+            pos = adv_data.find(uuid, start_idx, end_idx)
+            while pos != -1:
+                if (pos - start_idx) % uuid_length == 0:
+                    return True
+                pos = adv_data.find(uuid, pos + 1, end_idx)
+        # Advance to the next AD structure.
+        i += ad_field_length + 1
     # UUID not found.
     return False
@@ -62,83 +62,85 @@ class App(BluetoothApp):
 
     def gattdb_init(self):
         """ Initialize GATT database. """
-        _, session = self.lib.bt.gattdb.new_session()
+        gattdb = self.lib.bt.gattdb
+        read = gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_READ
+        write = gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_WRITE
+        _, session = gattdb.new_session()
 
         # Generic Access
-        _, service = self.lib.bt.gattdb.add_service(
+        _, service = gattdb.add_service(
             session,
-            self.lib.bt.gattdb.SERVICE_TYPE_PRIMARY_SERVICE,
+            gattdb.SERVICE_TYPE_PRIMARY_SERVICE,
             0,
             b"\x00\x18"
         )
         # Device Name
-        self.lib.bt.gattdb.add_uuid16_characteristic(
+        gattdb.add_uuid16_characteristic(
             session,
             service,
-            self.lib.bt.gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_READ |
-            self.lib.bt.gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_WRITE,
+            read | write,
             0,
             0,
             b"\x00\x2A",
-            self.lib.bt.gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
+            gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
             len(GATTDB_DEVICE_NAME),
             GATTDB_DEVICE_NAME
         )
         # Appearance
-        self.lib.bt.gattdb.add_uuid16_characteristic(
+        gattdb.add_uuid16_characteristic(
             session,
             service,
-            self.lib.bt.gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_READ,
+            read,
             0,
             0,
             b"\x01\x2A",
-            self.lib.bt.gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
+            gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
             2,
             b"\x00\x00"
         )
-        self.lib.bt.gattdb.start_service(session, service)
+        gattdb.start_service(session, service)
 
         # Device Information
-        _, service = self.lib.bt.gattdb.add_service(
+        _, service = gattdb.add_service(
             session,
-            self.lib.bt.gattdb.SERVICE_TYPE_PRIMARY_SERVICE,
+            gattdb.SERVICE_TYPE_PRIMARY_SERVICE,
             0,
             b"\x0A\x18"
         )
         # Manufacturer Name String
-        self.lib.bt.gattdb.add_uuid16_characteristic(
+        gattdb.add_uuid16_characteristic(
             session,
             service,
-            self.lib.bt.gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_READ,
+            read,
             0,
             0,
             b"\x29\x2A",
-            self.lib.bt.gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
+            gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
             len(GATTDB_MANUFACTURER_NAME_STRING),
             GATTDB_MANUFACTURER_NAME_STRING
         )
         # System ID
         # Pad and reverse unique ID to get System ID.
-        addr = self.address.split(":")
-        system_id = bytes.fromhex("".join(addr[:3] + ["ff", "fe"] + addr[3:]))
-        self.lib.bt.gattdb.add_uuid16_characteristic(
+        address = bytes.fromhex(self.address.replace(":", ""))
+        system_id = address[:3] + b"\xff\xfe" + address[3:]
+        gattdb.add_uuid16_characteristic(
             session,
             service,
-            self.lib.bt.gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_READ,
+            read,
             0,
             0,
             b"\x23\x2A",
-            self.lib.bt.gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
+            gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
             8,
             system_id
         )
-        self.lib.bt.gattdb.start_service(session, service)
+        gattdb.start_service(session, service)
 
         ################################
         # Add further attributes here. #
         ################################
 
-        self.lib.bt.gattdb.commit(session)
+        gattdb.commit(session)
 
     def adv_start(self):
         """ Start advertising. """
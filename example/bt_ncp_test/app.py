@@ -31,7 +31,6 @@ creating custom commands or for testing purposes.
 import argparse
 import enum
 import os.path
-import random
 import sys
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
@@ -39,6 +38,8 @@ from common.util import ArgumentParser, BluetoothApp, get_connector
 
 DEFAULT_MESSAGE_LENGTH = 180
 DEFAULT_INTERVAL_MS = 20
+# Number of test iterations between progress updates on the console
+PROGRESS_INTERVAL = 32
 
 class UserCommandId(enum.IntEnum):
     """ IDs of the user commands """
@@ -57,6 +58,9 @@ class App(BluetoothApp):
         self.test_interval = args.interval
         self.test_end = args.end
         self.test_iteration = 0
+        # The expected event payload is derived from the iteration counter.
+        # Precompute the payload for every possible counter value.
+        self.expected_data = [bytes([value]) * (self.test_length - 1) for value in range(256)]
 
     def bt_evt_system_boot(self, evt):
         """ Bluetooth event callback """
@@ -68,8 +72,8 @@ class App(BluetoothApp):
             self.log.info(f"Parameters: Width={self.test_length}, End={self.test_end}")
             # Note that there is no event processing until the end of this iteration.
             for i in range(self.test_end):
-                print(f"\rTest iteration {i} ", end="")
-                self.echo(self.test_length)
+                self.show_progress(i)
+                self.echo(self.test_length, i)
             print("")
             self.log.info("Test passed.")
             self.stop()
@@ -81,21 +85,22 @@ class App(BluetoothApp):
 
     def bt_evt_user_message_to_host(self, evt):
         """ Bluetooth event callback """
-        user_event_id = evt.message[0]
-        user_event_data = evt.message[1:]
+        # Slicing the memoryview doesn't copy the payload.
+        message = memoryview(evt.message)
+        user_event_id = message[0]
+        user_event_data = message[1:]
 
         if user_event_id == UserCommandId.PERIODIC_ASYNC:
-            print(f"\rTest iteration {self.test_iteration} ", end="")
+            self.show_progress(self.test_iteration)
 
             if len(evt.message) != self.test_length:
-                raise RuntimeError(f"Unexpected event length. Expected: {self.test_length}. "
-                                   f"Received: {len(evt.message)}.")
+                raise RuntimeError(f"Unexpected event length in iteration {self.test_iteration}. "
+                                   f"Expected: {self.test_length}. Received: {len(evt.message)}.")
 
-            # The expected event payload is derived from the iteration counter.
-            expected_data = bytes([self.test_iteration % 256]) * (self.test_length - 1)
+            expected_data = self.expected_data[self.test_iteration % 256]
             if user_event_data != expected_data:
-                raise RuntimeError(f"Unexpected event data. Expected: 0x{expected_data.hex()}. "
-                                   f"Received: 0x{user_event_data.hex()}.")
+                raise RuntimeError(f"Unexpected event data in iteration {self.test_iteration}. "
+                                   f"Expected: 0x{expected_data.hex()}. Received: 0x{user_event_data.hex()}.")
 
             self.test_iteration += 1
             if self.test_iteration >= self.test_end:
@@ -109,6 +114,12 @@ class App(BluetoothApp):
                            f"Received: {user_event_id}.")
             return
 
+    def show_progress(self, iteration):
+        """ Update the progress line periodically and on the last iteration. """
+        if iteration % PROGRESS_INTERVAL == 0 or iteration == self.test_end - 1:
+            sys.stdout.write(f"\rTest iteration {iteration} ")
+            sys.stdout.flush()
+
     def get_board_name(self):
         """ Send user command to get the board name as string. """
         command = bytes([UserCommandId.GET_BOARD_NAME])
@@ -133,14 +144,14 @@ class App(BluetoothApp):
             raise RuntimeError(f"Unexpected response. Expected: 0x{expected_response.hex()}. "
                                f"Received: 0x{response.hex()}.")
 
-    def echo(self, length):
+    def echo(self, length, iteration):
         """ Send user command with random data as payload and expect the same payload as response. """
-        command = bytes([UserCommandId.ECHO]) + random.randbytes(length)
+        command = bytes([UserCommandId.ECHO]) + os.urandom(length)
         expected_data = command
         _, response = self.lib.bt.user.message_to_target(command)
         if response != expected_data:
-            raise RuntimeError(f"Unexpected response. Expected: 0x{expected_data.hex()}. "
-                               f"Received: 0x{response.hex()}.")
+            raise RuntimeError(f"Unexpected response in iteration {iteration}. "
+                               f"Expected: 0x{expected_data.hex()}. Received: 0x{response.hex()}.")
 
 def check_int(min_value=None, max_value=None):
     """ Helper for checking integer range. """
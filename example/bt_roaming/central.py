@@ -24,19 +24,18 @@
 #    misrepresented as being the original software.
 # 3. This notice may not be removed or altered from any source distribution.
 
+import collections
+import concurrent.futures
 from dataclasses import dataclass
 import json
 import logging
 import os
-import pathlib
-import queue
-import shutil
-import subprocess
+import signal
 import sys
 import time
 import threading
-import webbrowser
 import bgapi
+from bgapi.connector import ConnectorException
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
 from common.util import ArgumentParser, BluetoothApp, get_connector, find_service_in_advertisement
@@ -58,6 +57,8 @@ CONNECTION_TIMEOUT = 3
 SCANNING_TIMEOUT = 3
 # Duration of the connection analysis in seconds
 CONNECTION_ANALYSIS_TIMEOUT = 3
+# Connection analysis of the same device is repeated at most with this time interval in seconds
+CONNECTION_ANALYSIS_PERIOD = 30
 # Periodic scanning is performed with this time interval in seconds
 SCANNING_PERIOD = 30
 # Periodic RSSI measurements on connected devices are performed with this time interval in seconds
@@ -77,37 +78,52 @@ class Connection:
     address: str
     address_type: int
     bonding_data: dict
-    opened: threading.Event
+    # Resolved to True when the connection is opened, to False if it's closed before
+    opened: concurrent.futures.Future
     rssi: int=None
     service: int=None
     characteristic: int=None
     notification: bool=False
 
+# Events are created at high rate, __slots__ avoids the per-instance __dict__.
+# dataclass(slots=True) would require Python 3.10.
 class ApEvent:
     """ Generic event reported by the access point """
+    __slots__ = ()
 
 class ApEventConnectionOpened(ApEvent):
     """ Connection has been opened """
+    __slots__ = ()
 
 class ApEventConnectionClosed(ApEvent):
     """ Connection has been closed intentionally """
+    __slots__ = ()
 
 class ApEventConnectionLost(ApEvent):
     """ Connection has been closed accidentally """
+    __slots__ = ()
 
+@dataclass
 class ApEventBondingDbChanged(ApEvent):
     """ Bonding database entry has changed """
+    __slots__ = ("address", "type", "data")
+    address: str
+    type: int
+    data: bytes
 
 @dataclass
 class ApEventConnectionRssi(ApEvent):
     """ RSSI value measured on connected devices """
+    __slots__ = ("ap_id", "connection", "address", "rssi")
     ap_id: int
     connection: int
+    address: str
     rssi: int
 
 @dataclass
 class ApEventScanRssi(ApEvent):
     """ RSSI value measured on advertising devices """
+    __slots__ = ("ap_id", "address", "rssi")
     ap_id: int
     address: tuple
     rssi: int
@@ -115,39 +131,78 @@ class ApEventScanRssi(ApEvent):
 @dataclass
 class ApEventAnalyzerRssi(ApEvent):
     """ RSSI value measured by connection analyzer """
+    __slots__ = ("ap_id", "rssi")
     ap_id: int
     rssi: int
 
+# Events that change the network graph
+GRAPH_EVENTS = frozenset((ApEventConnectionRssi,
+                          ApEventConnectionOpened,
+                          ApEventConnectionClosed,
+                          ApEventConnectionLost))
+
+class ApEventQueue:
+    """ Queue of access point events """
+    def __init__(self):
+        self._events = collections.deque()
+        self._cond = threading.Condition(threading.Lock())
+
+    def put(self, evt: ApEvent):
+        """ Add event to the queue and wake up a consumer """
+        with self._cond:
+            self._events.append(evt)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """ Remove and return the next event, return None on timeout """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._events, timeout):
+                return None
+            return self._events.popleft()
+
+    def get_all(self, timeout=None):
+        """ Remove and return all events, wait for the first one, return empty list on timeout """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._events, timeout):
+                return []
+            events = list(self._events)
+            self._events.clear()
+            return events
+
 class AccessPoint(BluetoothApp):
     """ Roaming Access Point """
     def __init__(self,
                  connector,
-                 event_queue: queue.Queue,
+                 event_queue: ApEventQueue,
                  identity_address=None,
                  identity_type=None):
         self._event_queue = event_queue
         self._identity_address = identity_address
         self._identity_type = identity_type
         self.ready = threading.Event()
-        self.connections = dict[int, Connection]()
+        self.connections: dict[int, Connection] = {}
         self.analyzer = None
-        self._rssi_thread = threading.Thread(target=self._rssi_task, daemon=True)
-        self._rssi_thread.start()
         super().__init__(connector)
+        # Bind the BGAPI classes used in the event callbacks to avoid attribute chain lookups
+        self._scanner = self.lib.bt.scanner
+        self._connection = self.lib.bt.connection
+        self._gatt = self.lib.bt.gatt
+        self._sm = self.lib.bt.sm
+        self._bondingdb = self.lib.bt.external_bondingdb
 
     def start_scan(self):
         """ Start scanning """
-        self.lib.bt.scanner.start(
-            self.lib.bt.scanner.SCAN_PHY_SCAN_PHY_1M,
-            self.lib.bt.scanner.DISCOVER_MODE_DISCOVER_GENERIC)
+        self._scanner.start(
+            self._scanner.SCAN_PHY_SCAN_PHY_1M,
+            self._scanner.DISCOVER_MODE_DISCOVER_GENERIC)
 
     def stop_scan(self):
         """ Stop scanning """
-        self.lib.bt.scanner.stop()
+        self._scanner.stop()
 
     def get_conn_params(self, conn_handle):
         """ Get connection parameters for connection analysis """
-        return self.lib.bt.connection.get_scheduling_details(conn_handle)
+        return self._connection.get_scheduling_details(conn_handle)
 
     def start_analyzer(self, conn_params):
         """ Start connection analysis """
@@ -192,23 +247,28 @@ class AccessPoint(BluetoothApp):
             address_type = self.lib.bt.gap.ADDRESS_TYPE_PUBLIC_ADDRESS
         if bonding_data is None:
             bonding_data = {}
-        _, connection = self.lib.bt.connection.open(
+        _, connection = self._connection.open(
             address,
             address_type,
             self.lib.bt.gap.PHY_PHY_1M)
+        opened = concurrent.futures.Future()
         self.connections[connection] = Connection(address,
                                                   address_type,
                                                   bonding_data,
-                                                  threading.Event(),
+                                                  opened,
                                                   rssi)
-        if not self.connections[connection].opened.wait(timeout=CONNECTION_TIMEOUT):
-            self.log.warning(f"failed to open connection to {address}")
+        try:
+            if not opened.result(timeout=CONNECTION_TIMEOUT):
+                # No need to wait for the timeout if the connection attempt has already failed.
+                self.log.warning("failed to open connection to %s", address)
+        except concurrent.futures.TimeoutError:
+            self.log.warning("failed to open connection to %s", address)
             self.disconnect(connection)
 
     def disconnect(self, conn_handle):
         """ Close connection """
         try:
-            self.lib.bt.connection.close(conn_handle)
+            self._connection.close(conn_handle)
         except bgapi.bglib.CommandFailedError as err:
             # Connection may already be closed at this point.
             if err.errorcode == status.INVALID_HANDLE:
@@ -217,28 +277,25 @@ class AccessPoint(BluetoothApp):
                 self.log.error("failed to close connection '%d' with status %#x: '%s'",
                                conn_handle, err.errorcode, err.errorcode)
 
-    def _rssi_task(self):
-        """ Monitor connection RSSI """
-        while True:
-            # Avoid RuntimeError if a connection is closed during iteration
-            conn_list = list(self.connections.keys())
-            for conn in conn_list:
-                try:
-                    address = self.connections[conn].address
-                    _, rssi = self.lib.bt.connection.get_median_rssi(conn)
-                    self.log.info(f"RSSI [{address}]: {rssi} dBm")
-                    self.connections[conn].rssi = rssi
-                    self._event_queue.put(ApEventConnectionRssi(self.id, conn, rssi))
-                except bgapi.bglib.CommandFailedError:
-                    pass
-            time.sleep(RSSI_MEASUREMENT_PERIOD)
+    def measure_rssi(self):
+        """ Measure RSSI on all connections """
+        # Iterate over a snapshot to avoid RuntimeError if a connection is closed during iteration
+        for conn, connection in self.connections.copy().items():
+            try:
+                _, rssi = self._connection.get_median_rssi(conn)
+                self.log.info("RSSI [%s]: %d dBm", connection.address, rssi)
+                connection.rssi = rssi
+                self._event_queue.put(ApEventConnectionRssi(self.id, conn, connection.address, rssi))
+            except bgapi.bglib.CommandFailedError:
+                # Connection may be closed in the meantime
+                pass
 
     # Common event callbacks
     def bt_evt_system_boot(self, evt):
         """ Bluetooth event callback """
         # Check if external bonding database feature is available on the target
         try:
-            self.lib.bt.sm.get_bonding_handles(0)
+            self._sm.get_bonding_handles(0)
             self.log.error("External bonding database feature missing from the target firmware.")
             self.stop()
             return
@@ -250,9 +307,9 @@ class AccessPoint(BluetoothApp):
             if self._identity_type is None:
                 self._identity_type = self.lib.bt.gap.ADDRESS_TYPE_PUBLIC_ADDRESS
             self.lib.bt.gap.set_identity_address(self._identity_address, self._identity_type)
-        self.lib.bt.sm.set_bondable_mode(1)
+        self._sm.set_bondable_mode(1)
         # Connection timing parameters are critical for the connection analyzer feature to work properly
-        self.lib.bt.connection.set_default_parameters(
+        self._connection.set_default_parameters(
             CONNECTION_INTERVAL_MIN,
             CONNECTION_INTERVAL_MAX,
             0,     # latency
@@ -264,12 +321,12 @@ class AccessPoint(BluetoothApp):
 
     def bt_evt_scanner_legacy_advertisement_report(self, evt):
         """ Bluetooth event callback """
-        # Filter irrelevant events
-        if not scan_filter(evt):
-            return
-        connectable = evt.event_flags & self.lib.bt.scanner.EVENT_FLAG_EVENT_FLAG_CONNECTABLE
+        # Filter irrelevant events, check the cheap event flags before parsing the advertising data
+        connectable = evt.event_flags & self._scanner.EVENT_FLAG_EVENT_FLAG_CONNECTABLE
         if not connectable:
             return
+        if not scan_filter(evt):
+            return
         self._event_queue.put(ApEventScanRssi(self.id,
                                               (evt.address, evt.address_type),
                                               evt.rssi))
@@ -279,7 +336,7 @@ class AccessPoint(BluetoothApp):
         if evt.analyzer != self.analyzer:
             self.log.warning("Report event from unexpected analyzer: %d", evt.analyzer)
             return
-        if evt.peripheral_rssi == self.lib.bt.connection.RSSI_CONST_RSSI_UNAVAILABLE:
+        if evt.peripheral_rssi == self._connection.RSSI_CONST_RSSI_UNAVAILABLE:
             # No valid RSSI value available, drop this event
             return
         self._event_queue.put(ApEventAnalyzerRssi(self.id, evt.peripheral_rssi))
@@ -294,15 +351,18 @@ class AccessPoint(BluetoothApp):
 
     def bt_evt_connection_opened(self, evt):
         """ Bluetooth event callback """
-        self.log.info(f"Connection opened: {evt.address}")
-        self.connections[evt.connection].opened.set()
+        self.log.info("Connection opened: %s", evt.address)
+        self.connections[evt.connection].opened.set_result(True)
         self._event_queue.put(ApEventConnectionOpened())
 
     def bt_evt_connection_closed(self, evt):
         """ Bluetooth event callback """
-        address = self.connections[evt.connection].address
-        self.log.info(f"Connection to {address} closed with reason {evt.reason:#x}: '{evt.reason}'")
-        del self.connections[evt.connection]
+        connection = self.connections.pop(evt.connection)
+        self.log.info("Connection to %s closed with reason %#x: '%s'",
+                      connection.address, evt.reason, evt.reason)
+        if not connection.opened.done():
+            # Connection closed before it was opened, wake up the pending connect call.
+            connection.opened.set_result(False)
         if evt.reason == status.BT_CTRL_CONNECTION_TERMINATED_BY_LOCAL_HOST:
             self._event_queue.put(ApEventConnectionClosed())
         else:
@@ -313,31 +373,32 @@ class AccessPoint(BluetoothApp):
         if evt.security_mode != 0:
             # Successfully bonded
             # Start GATT discovery with finding the service handle
-            self.lib.bt.gatt.discover_primary_services_by_uuid(
+            self._gatt.discover_primary_services_by_uuid(
                 evt.connection,
                 GATT_SERVICE_UUID)
 
     def bt_evt_sm_bonding_failed(self, evt):
         """ Bluetooth event callback """
         address = self.connections[evt.connection].address
-        self.log.error(f"Bonding with {address} failed with reason {evt.reason:#x}: '{evt.reason}'")
+        self.log.error("Bonding with %s failed with reason %#x: '%s'", address, evt.reason, evt.reason)
 
     # External bonding database event callbacks
     def bt_evt_external_bondingdb_data_request(self, evt):
         """ Bluetooth event callback """
         # 0 length data means that the data is not available in the external bonding DB
         data = self.connections[evt.connection].bonding_data.get(evt.type, b"")
-        self.lib.bt.external_bondingdb.set_data(evt.connection, evt.type, data)
+        self._bondingdb.set_data(evt.connection, evt.type, data)
 
     def bt_evt_external_bondingdb_data(self, evt):
         """ Bluetooth event callback """
-        self.connections[evt.connection].bonding_data[evt.type] = evt.data
-        self._event_queue.put(ApEventBondingDbChanged())
+        connection = self.connections[evt.connection]
+        connection.bonding_data[evt.type] = evt.data
+        self._event_queue.put(ApEventBondingDbChanged(connection.address, evt.type, evt.data))
 
     def bt_evt_external_bondingdb_data_ready(self, evt):
         """ Bluetooth event callback """
         # Initiate bonding
-        self.lib.bt.sm.increase_security(evt.connection)
+        self._sm.increase_security(evt.connection)
 
     # GATT event callbacks
     def bt_evt_gatt_service(self, evt):
@@ -353,21 +414,22 @@ class AccessPoint(BluetoothApp):
     def bt_evt_gatt_procedure_completed(self, evt):
         """ Bluetooth event callback """
         if evt.result != status.OK:
-            self.log.error(f"GATT procedure completed with status {evt.result:#x}: {evt.result}")
+            self.log.error("GATT procedure completed with status %#x: %s", evt.result, evt.result)
             return
-        if self.connections[evt.connection].characteristic is None:
+        connection = self.connections[evt.connection]
+        if connection.characteristic is None:
             # Continue GATT discovery with finding the characteristic handle
-            self.lib.bt.gatt.discover_characteristics_by_uuid(
+            self._gatt.discover_characteristics_by_uuid(
                 evt.connection,
-                self.connections[evt.connection].service,
+                connection.service,
                 GATT_CHARACTERISTIC_UUID)
-        elif not self.connections[evt.connection].notification:
+        elif not connection.notification:
             # Finally, request notification for the characteristic
-            self.lib.bt.gatt.set_characteristic_notification(
+            self._gatt.set_characteristic_notification(
                 evt.connection,
-                self.connections[evt.connection].characteristic,
-                self.lib.bt.gatt.CLIENT_CONFIG_FLAG_NOTIFICATION)
-            self.connections[evt.connection].notification = True
+                connection.characteristic,
+                self._gatt.CLIENT_CONFIG_FLAG_NOTIFICATION)
+            connection.notification = True
 
     def bt_evt_gatt_characteristic_value(self, evt):
         """ Bluetooth event callback """
@@ -381,91 +443,161 @@ class NetworkCoordinator:
             self.rssi_threshold = -127
         else:
             self.rssi_threshold = rssi_th
-        self._event_queue: "queue.Queue[ApEvent]" = queue.Queue()
-        self._analyzer_queue: "queue.Queue[ApEventConnectionRssi]" = queue.Queue()
+        self._event_queue = ApEventQueue()
+        self._analyzer_queue = ApEventQueue()
         self._ap_lock = threading.Lock() # prohibit parallel scanning and connection analysis
         self._start_scan = threading.Event()
-        self._scan_result = dict[tuple, dict]()
+        # Worker threads stop issuing commands to the access points once set
+        self._stopped = threading.Event()
+        self._scan_result = collections.defaultdict(dict)
         self._analyzer_result = {}
-        self._bonding_db = load_bonding_db()
-        self._bonding_db_dirty = threading.Event()
-        self._graph_dirty = threading.Event()
-        self.ap_dict = dict[int, AccessPoint]()
+        # Time of the last connection analysis request per device address
+        self._last_analysis = {}
+        # Bonding data entries are created on first access
+        self._bonding_db = collections.defaultdict(dict, load_bonding_db())
+        # Hex encoded copy of the bonding database as stored in the file, updated on change
+        self._bonding_db_hex = collections.defaultdict(dict, {
+            address: {key: value.hex() for key, value in data.items()}
+            for address, data in self._bonding_db.items()})
+        # The hex database is updated by the event handler thread and saved by the deferred task thread
+        self._bonding_db_lock = threading.Lock()
+        self._bonding_db_changed = False
+        # The database file is written either by the deferred task thread or on stop
+        self._bonding_db_file_lock = threading.Lock()
+        # Deferred tasks with their monotonic deadlines, executed by the deferred task thread
+        self._deferred_tasks = {}
+        # Latest possible deadlines of the deferred tasks that are postponed on every request
+        self._deferred_limits = {}
+        self._deferred_cond = threading.Condition()
+        self._view_graph = False
+        self._last_graph = None
+        self.ap_dict: dict[int, AccessPoint] = {}
         for connector in connectors:
             ap = AccessPoint(connector,
                              self._event_queue,
                              identity_address=IDENTITY_ADDRESS)
             self.ap_dict[ap.id] = ap
         self.log = logging.getLogger(type(self).__name__)
-        self._threads = list[threading.Thread]()
+        # Issue blocking commands to the access points in parallel
+        self._ap_pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(self.ap_dict)))
+        self._threads: list[threading.Thread] = []
         self._threads.append(threading.Thread(target=self.event_handler, daemon=True))
         self._threads.append(threading.Thread(target=self.scan_scheduler, daemon=True))
         self._threads.append(threading.Thread(target=self.scan_task, daemon=True))
         self._threads.append(threading.Thread(target=self.analyzer_task, daemon=True))
-        self._threads.append(threading.Thread(target=self.bonding_db_task, daemon=True))
+        self._threads.append(threading.Thread(target=self.rssi_task, daemon=True))
+        self._threads.append(threading.Thread(target=self.deferred_task, daemon=True))
         if graph:
+            # Modules of the graph viewer are imported only if the feature is enabled.
+            import shutil
             if shutil.which("dot") is None:
                 self.log.error("Graphviz dot tool not found, continue without network graph viewer")
             else:
-                self._graph_thread = threading.Thread(target=self.graph_task, daemon=True)
+                self._view_graph = True
 
     def start(self):
         """ Start access points and wait for boot event, start worker threads """
+        # Access points run in their own threads, i.e. they boot in parallel.
         for ap in self.ap_dict.values():
             ap.start()
+        # Wait for all access points with a common deadline.
+        deadline = time.monotonic() + BOOT_TIMEOUT
         for ap in self.ap_dict.values():
-            if not ap.ready.wait(timeout=BOOT_TIMEOUT):
+            if not ap.ready.wait(timeout=max(0, deadline - time.monotonic())):
                 raise RuntimeError(f"AP#{ap.id} failed to boot")
         self.log.info("all access points booted")
         for thread in self._threads:
             thread.start()
-        if hasattr(self, "_graph_thread"):
-            self._graph_thread.start()
 
     def stop(self):
         """ Stop all access points. """
-        for ap in self.ap_dict.values():
-            ap.stop()
+        self._stopped.set()
+        # Wake up the scan task to let it terminate.
+        self._start_scan.set()
+        # Cancel the access point calls that haven't started yet.
+        self._ap_pool.shutdown(wait=False, cancel_futures=True)
+        # Wait for the ongoing scanning or connection analysis procedure to return
+        # before the access points are closed.
+        with self._ap_lock:
+            for ap in self.ap_dict.values():
+                ap.stop()
+        # The deferred task thread is a daemon thread, save pending bonding database changes now.
+        # The save waits for the deferred task thread if it's saving already, and writes the file
+        # only if there are unsaved changes.
+        with self._deferred_cond:
+            self._deferred_tasks.pop(self.save_bonding_db, None)
+            self._deferred_limits.pop(self.save_bonding_db, None)
+        self.save_bonding_db()
 
     def scan(self):
         """ Scan for and connect to devices. """
         # clear scan result
-        self._scan_result = dict[tuple, dict]()
+        self._scan_result = collections.defaultdict(dict)
         self.log.info("scan for devices...")
         # select only connectable access points for scanning
         scan_ap_list = [ap for ap in self.ap_dict.values() if ap.connectable]
-        for ap in scan_ap_list:
-            ap.start_scan()
-        time.sleep(SCANNING_TIMEOUT)
-        for ap in scan_ap_list:
-            ap.stop_scan()
-        if len(self._scan_result) == 0:
+        if len(scan_ap_list) == 0:
+            self.log.info("no free connection slots, skip scanning")
+            return
+        self.for_each_ap(AccessPoint.start_scan, scan_ap_list)
+        if self._stopped.wait(SCANNING_TIMEOUT):
+            return
+        self.for_each_ap(AccessPoint.stop_scan, scan_ap_list)
+        # Take over the scan result, late scan reports are collected in a new dict
+        # that doesn't change during the iteration.
+        scan_result = self._scan_result
+        self._scan_result = collections.defaultdict(dict)
+        if len(scan_result) == 0:
             self.log.info("no devices found")
             return
         self.log.info("device(s) found:")
-        self.log.info(self._scan_result)
-        # The following iteration walks through the discovered devices and picks the access point
-        # with the best available RSSI to connect to. This algorithm disregards the fact that APs
-        # have only a limited number of connections, and is therefore suboptimal under certain
-        # conditions.
-        for (address, address_type), result in self._scan_result.items():
-            # remove non-connectable APs from the results
-            result = {ap_id: rssi for ap_id, rssi in result.items() if self.ap_dict[ap_id].connectable}
-            if len(result) == 0:
+        self.log.info(dict(scan_result))
+        # The following iteration walks through the discovered devices and assigns them to the
+        # access point with the best available RSSI. The free connection slots of the access points
+        # are accounted for, but the assignment is still greedy in the order of discovery, and is
+        # therefore suboptimal under certain conditions.
+        free_slots = {ap_id: SL_BT_CONFIG_MAX_CONNECTIONS - len(ap.connections)
+                      for ap_id, ap in self.ap_dict.items()}
+        # devices assigned to the access points
+        devices = collections.defaultdict(list)
+        for (address, address_type), result in scan_result.items():
+            # find access point with the largest RSSI value among the APs with free connection slots
+            best = max(((ap_id, rssi) for ap_id, rssi in result.items() if free_slots[ap_id] > 0),
+                       key=lambda item: item[1],
+                       default=None)
+            if best is None:
                 self.log.warning("No AP available to connect to %s", address)
                 continue
-            # find access point with the largest RSSI value
-            ap_id = max(result, key=result.get)
-            self.ap_dict[ap_id].connect(
+            ap_id, rssi = best
+            free_slots[ap_id] -= 1
+            devices[ap_id].append((address, address_type, rssi))
+        # An access point can open only one connection at a time, but the access points
+        # connect to their devices in parallel.
+        self.for_each_ap(self.connect_devices,
+                         [self.ap_dict[ap_id] for ap_id in devices],
+                         devices.values())
+
+    def for_each_ap(self, func, ap_list, *args):
+        """ Call func for every access point in parallel and wait for completion.
+
+        Additional iterables in args provide further arguments per access point.
+        The first exception raised by func is propagated.
+        """
+        list(self._ap_pool.map(func, ap_list, *args))
+
+    def connect_devices(self, ap: AccessPoint, devices: list):
+        """ Connect access point to the given devices one after the other. """
+        for address, address_type, rssi in devices:
+            if self._stopped.is_set():
+                return
+            ap.connect(
                 address=address,
                 address_type=address_type,
                 bonding_data=self.get_bonding_data(address),
-                rssi=result[ap_id])
+                rssi=rssi)
 
     def update_scan_result(self, evt: ApEventScanRssi):
         """ Collect scan report events from various access points. """
-        if evt.address not in self._scan_result.keys():
-            self._scan_result[evt.address] = {}
         # New RSSI value overwrites old one (i.e. no averaging)
         self._scan_result[evt.address][evt.ap_id] = evt.rssi
 
@@ -480,23 +612,18 @@ class NetworkCoordinator:
         if len(ap_list) == 0:
             self.log.info("No APs available for connection analysis")
             return
-        for ap in ap_list:
-            ap.start_analyzer(conn_params)
-        time.sleep(CONNECTION_ANALYSIS_TIMEOUT)
-        for ap in ap_list:
-            ap.stop_analyzer()
+        self.for_each_ap(lambda ap: ap.start_analyzer(conn_params), ap_list)
+        if self._stopped.wait(CONNECTION_ANALYSIS_TIMEOUT):
+            return
+        self.for_each_ap(AccessPoint.stop_analyzer, ap_list)
         # Check if result dict is empty
         if not self._analyzer_result:
             self.log.info("No RSSI values available from connection analysis for %s", address)
             return
-        # Actual connection RSSI is considered the best initially
-        best_rssi = rssi
-        best_ap = ap_id
-        for _ap_id, _rssi in self._analyzer_result.items():
-            if _rssi > best_rssi and _rssi > self.rssi_threshold:
-                best_ap = _ap_id
-                best_rssi = _rssi
-        if best_ap == ap_id:
+        # Switch only if the best AP measured a better RSSI than the actual connection
+        # and the RSSI is above the threshold.
+        best_ap, best_rssi = max(self._analyzer_result.items(), key=lambda item: item[1])
+        if best_rssi <= rssi or best_rssi <= self.rssi_threshold:
             self.log.info("%s - stay at AP#%d (%d dBm), no better AP available",
                           address, ap_id, rssi)
             return
@@ -515,113 +642,207 @@ class NetworkCoordinator:
     def update_analyzer_result(self, evt: ApEventAnalyzerRssi):
         """ Collect RSSI measurements from various access points. """
         # RSSI values are expected only from one address
-        if evt.ap_id not in self._analyzer_result.keys():
+        rssi = self._analyzer_result.get(evt.ap_id)
+        if rssi is None:
             # Store first RSSI value from AP
             self._analyzer_result[evt.ap_id] = evt.rssi
         else:
             # Upcoming RSSI values are averaged with the previous value
-            self._analyzer_result[evt.ap_id] += evt.rssi
-            self._analyzer_result[evt.ap_id] /= 2
+            self._analyzer_result[evt.ap_id] = (rssi + evt.rssi) / 2
 
     def get_bonding_data(self, address):
         """ Provide bonding data for connection """
-        if address not in self._bonding_db.keys():
-            # Create bonding data entry if not available yet
-            self._bonding_db[address] = {}
+        # Bonding data entry is created if not available yet
         return self._bonding_db[address]
 
+    def update_connection_rssi(self, evt: ApEventConnectionRssi):
+        """ Check RSSI measurements of connected devices. """
+        if evt.rssi < self.rssi_threshold:
+            # Trigger connection analysis unless it was done recently for this device,
+            # e.g. because no better AP was available. Connection handles are reused
+            # by the controller, so the device is identified by its address.
+            now = time.monotonic()
+            last = self._last_analysis.get(evt.address)
+            if last is None or now - last >= CONNECTION_ANALYSIS_PERIOD:
+                # Forget the devices with expired period, e.g. the ones that have left the network.
+                self._last_analysis = {
+                    address: started for address, started in self._last_analysis.items()
+                    if now - started < CONNECTION_ANALYSIS_PERIOD}
+                self._last_analysis[evt.address] = now
+                self._analyzer_queue.put(evt)
+
+    def update_bonding_db(self, evt: ApEventBondingDbChanged):
+        """ Update the hex encoded copy of the bonding database. """
+        with self._bonding_db_lock:
+            self._bonding_db_hex[evt.address][evt.type] = evt.data.hex()
+            self._bonding_db_changed = True
+
     def event_handler(self):
         """ Handle events from all access points """
+        # Event specific handlers, the remaining events only trigger the actions after the batch.
+        handlers = {
+            ApEventConnectionRssi: self.update_connection_rssi,
+            ApEventAnalyzerRssi: self.update_analyzer_result,
+            ApEventScanRssi: self.update_scan_result,
+            ApEventBondingDbChanged: self.update_bonding_db,
+        }
         while True:
-            try:
-                # Timeout is needed for Windows hosts to get the KeyboardInterrupt in the main thread.
-                evt = self._event_queue.get(timeout=0.5)
-            except queue.Empty:
-                continue
-            if isinstance(evt, (ApEventConnectionRssi,
-                                ApEventConnectionOpened,
-                                ApEventConnectionClosed,
-                                ApEventConnectionLost)):
-                self._graph_dirty.set()
-
-            if isinstance(evt, ApEventConnectionRssi):
-                if evt.rssi < self.rssi_threshold:
-                    # Trigger connection analysis
-                    self._analyzer_queue.put(evt)
-            elif isinstance(evt, ApEventAnalyzerRssi):
-                self.update_analyzer_result(evt)
-            elif isinstance(evt, ApEventScanRssi):
-                self.update_scan_result(evt)
-            elif isinstance(evt, ApEventConnectionLost):
+            # This is a daemon thread, the KeyboardInterrupt is handled in the main thread.
+            # Process all pending events at once after a wakeup,
+            # notify the worker threads only once per batch.
+            evt_types = set()
+            for evt in self._event_queue.get_all():
+                evt_type = type(evt)
+                evt_types.add(evt_type)
+                handler = handlers.get(evt_type)
+                if handler is not None:
+                    handler(evt)
+            if self._view_graph and not evt_types.isdisjoint(GRAPH_EVENTS):
+                # Limit rendering frequency by adding delay
+                self.defer(self.update_graph, 1)
+            if ApEventConnectionLost in evt_types:
                 self._start_scan.set()
-            elif isinstance(evt, ApEventBondingDbChanged):
-                self._bonding_db_dirty.set()
+            if ApEventBondingDbChanged in evt_types:
+                # Delay writing to file to avoid too frequent file access,
+                # keep delaying as long as further changes arrive, but at most for 10 seconds.
+                self.defer(self.save_bonding_db, 1, max_delay=10)
 
     @property
     def graph(self):
         """ Graph representation of the network in dot language """
-        dot = 'graph G {\n'
+        lines = ['graph G {']
         # list access point nodes
         for ap_id in self.ap_dict.keys():
-            dot += f'{ap_id} [label="AP {ap_id}"]\n'
+            lines.append(f'{ap_id} [label="AP {ap_id}"]')
         # represent device nodes with box shape
-        dot += 'node [shape=box]\n'
+        lines.append('node [shape=box]')
         # list device nodes and edges
         for ap_id, ap in self.ap_dict.items():
-            for conn_id, conn in ap.connections.items():
+            # Connections may be opened or closed while the graph is generated
+            for conn_id, conn in ap.connections.copy().items():
                 # derive node name from access point ID and connection handle
                 node = f"{ap_id}_{conn_id}"
                 # unstable connections are marked with red color
                 color = ', color="red"' if conn.rssi < self.rssi_threshold else ''
-                dot += f'"{node}" [label="{conn.address}"{color}]\n'
-                dot += f'{ap_id} -- "{node}" [label="{conn.rssi} dBm"{color}]\n'
-        dot += '}\n'
-        return dot
+                lines.append(f'"{node}" [label="{conn.address}"{color}]')
+                lines.append(f'{ap_id} -- "{node}" [label="{conn.rssi} dBm"{color}]')
+        lines.append('}\n')
+        return "\n".join(lines)
 
     def scan_scheduler(self):
         """ Schedule scan procedure periodically """
         while True:
-            self._start_scan.set()
+            # Scanning is pointless if no access point can accept new connections.
+            if any(ap.connectable for ap in self.ap_dict.values()):
+                self._start_scan.set()
             time.sleep(SCANNING_PERIOD)
 
     def scan_task(self):
         """ Check for scan request """
-        while True:
+        while not self._stopped.is_set():
             self._start_scan.wait()
-            with self._ap_lock:
-                self.scan()
+            self.run_ap_procedure(self.scan)
             self._start_scan.clear()
 
     def analyzer_task(self):
         """ Check for connection analysis request """
-        while True:
-            try:
-                # Timeout is needed for Windows hosts to get the KeyboardInterrupt in the main thread.
-                evt = self._analyzer_queue.get(timeout=0.5)
-            except queue.Empty:
-                continue
+        while not self._stopped.is_set():
+            # This is a daemon thread, the KeyboardInterrupt is handled in the main thread.
+            evt = self._analyzer_queue.get()
             # Check if connection still exists
             if evt.connection in self.ap_dict[evt.ap_id].connections.keys():
-                with self._ap_lock:
-                    self.analyze_connection(evt.ap_id, evt.connection, evt.rssi)
+                self.run_ap_procedure(self.analyze_connection, evt.ap_id, evt.connection, evt.rssi)
 
-    def bonding_db_task(self):
-        """ Check if bonding database needs to be saved """
+    def run_ap_procedure(self, procedure, *args):
+        """ Run scanning or connection analysis procedure unless stopped. """
+        with self._ap_lock:
+            if self._stopped.is_set():
+                return
+            try:
+                procedure(*args)
+            except (bgapi.bglib.CommandError, ConnectorException, RuntimeError) as err:
+                # The thread pool refuses further calls once stopped.
+                if self._stopped.is_set():
+                    return
+                # Keep the worker thread running if an access point fails, e.g. to connect.
+                self.log.error("%s", err)
+
+    def rssi_task(self):
+        """ Monitor connection RSSI on all access points """
         while True:
-            self._bonding_db_dirty.wait()
-            # Delay writing to file to avoid too frequent file access
-            time.sleep(1)
-            self._bonding_db_dirty.clear()
-            save_bonding_db(self._bonding_db)
-
-    def graph_task(self):
-        """ Check if graph viewer needs to be updated """
+            for ap in self.ap_dict.values():
+                ap.measure_rssi()
+            time.sleep(RSSI_MEASUREMENT_PERIOD)
+
+    def defer(self, task, delay, max_delay=None):
+        """ Schedule task for execution in the deferred task thread after delay seconds.
+
+        A task that is already scheduled keeps its deadline unless max_delay is set.
+        In that case, the deadline is postponed by delay seconds, but not beyond
+        max_delay seconds after the task was first scheduled.
+        """
+        now = time.monotonic()
+        with self._deferred_cond:
+            if task not in self._deferred_tasks:
+                self._deferred_tasks[task] = now + delay
+                if max_delay is not None:
+                    self._deferred_limits[task] = now + max_delay
+                self._deferred_cond.notify()
+            elif task in self._deferred_limits:
+                # A later deadline doesn't need to wake up the deferred task thread.
+                self._deferred_tasks[task] = min(now + delay, self._deferred_limits[task])
+
+    def deferred_task(self):
+        """ Execute deferred tasks when their deadline expires """
         while True:
-            self._graph_dirty.wait()
-            # Limit rendering frequency by adding delay
-            time.sleep(1)
-            self._graph_dirty.clear()
-            view(self.graph)
+            with self._deferred_cond:
+                while True:
+                    now = time.monotonic()
+                    due = [task for task, deadline in self._deferred_tasks.items() if deadline <= now]
+                    if due:
+                        break
+                    if self._deferred_tasks:
+                        timeout = min(self._deferred_tasks.values()) - now
+                    else:
+                        timeout = None
+                    self._deferred_cond.wait(timeout)
+                for task in due:
+                    del self._deferred_tasks[task]
+                    self._deferred_limits.pop(task, None)
+            for task in due:
+                task()
+
+    def save_bonding_db(self):
+        """ Save bonding database to file """
+        with self._bonding_db_file_lock:
+            # Take a snapshot to keep the lock only for the copy, not for the file access.
+            with self._bonding_db_lock:
+                if not self._bonding_db_changed:
+                    return
+                db_hex = {address: data.copy() for address, data in self._bonding_db_hex.items()}
+                self._bonding_db_changed = False
+            try:
+                save_bonding_db(db_hex)
+            except OSError as err:
+                self.log.error("Failed to save bonding database: %s", err)
+                with self._bonding_db_lock:
+                    self._bonding_db_changed = True
+
+    def update_graph(self):
+        """ Update graph viewer if the network has changed """
+        graph = self.graph
+        # RSSI updates often leave the graph unchanged, skip rendering in this case.
+        if graph == self._last_graph:
+            return
+        # The graph viewer modules are imported only if the feature is enabled.
+        import subprocess
+        try:
+            view(graph)
+        except (OSError, subprocess.CalledProcessError) as err:
+            self.log.error("Failed to view network graph: %s", err)
+            return
+        # Remember the graph only if rendering succeeded to retry with the next update.
+        self._last_graph = graph
 
 def scan_filter(evt):
     """ Filter for selecting devices of interest """
@@ -629,9 +850,12 @@ def scan_filter(evt):
 
 def process_characteristic_value(ap: AccessPoint, evt):
     """ Process characteristic notification events """
+    # The value is only logged, skip processing if the message would be dropped anyway.
+    if not ap.log.isEnabledFor(logging.INFO):
+        return
     value = int(evt.value[1])
     address = ap.connections[evt.connection].address
-    ap.log.info(f"heart rate [{address}]: {value} BPM")
+    ap.log.info("heart rate [%s]: %d BPM", address, value)
 
 def load_bonding_db():
     """ Load bonding database from file """
@@ -639,24 +863,29 @@ def load_bonding_db():
         return {}
     with open(BONDING_DB_PATH, "r", encoding="utf-8") as bonding_db:
         db_in = json.load(bonding_db)
-        db_out = {}
-        for address, data in db_in.items():
-            db_out[address] = {int(key): bytes.fromhex(value) for key, value in data.items()}
-        return db_out
-
-def save_bonding_db(db_in: dict):
-    """ Save bonding database to file """
-    db_out = {}
-    for address, data in db_in.items():
-        db_out[address] = {key: value.hex() for key, value in data.items()}
-    with open(BONDING_DB_PATH, "w", encoding="utf-8") as bonding_db:
-        json.dump(db_out, bonding_db)
+    return {address: {int(key): bytes.fromhex(value) for key, value in data.items()}
+            for address, data in db_in.items()}
+
+def save_bonding_db(db_hex: dict):
+    """ Save hex encoded bonding database to file """
+    db_out = json.dumps(db_hex)
+    # Write to a temporary file first to keep the old database intact if writing fails.
+    tmp_path = BONDING_DB_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as bonding_db:
+        bonding_db.write(db_out)
+    os.replace(tmp_path, BONDING_DB_PATH)
 
 def view(dot: str):
     """ View network graph """
-    result = subprocess.run(["dot", "-Tsvg"], text=True, input=dot, stdout=subprocess.PIPE, check=True)
-    with open(NETWORK_GRAPH_PATH, "w", encoding="utf-8") as svg:
-        svg.write(result.stdout)
+    import pathlib
+    import subprocess
+    import webbrowser
+    # Let the dot tool write the image file directly. Write to a temporary file first
+    # to keep the previous image intact if the dot tool fails.
+    tmp_path = NETWORK_GRAPH_PATH + ".tmp"
+    with open(tmp_path, "wb") as svg:
+        subprocess.run(["dot", "-Tsvg"], input=dot.encode("utf-8"), stdout=svg, check=True)
+    os.replace(tmp_path, NETWORK_GRAPH_PATH)
     webbrowser.open(pathlib.Path(NETWORK_GRAPH_PATH).absolute().as_uri())
 
 def main():
@@ -686,8 +915,14 @@ def main():
     app.start()
     # Catch KeyboardInterrupt
     try:
-        while True:
-            time.sleep(60)
+        if sys.platform == "win32":
+            # The KeyboardInterrupt can interrupt a sleep but not a blocking wait on Windows.
+            while True:
+                time.sleep(60)
+        else:
+            # Sleep until a signal arrives without periodic wakeups.
+            while True:
+                signal.pause()
     except KeyboardInterrupt:
         app.stop()
 
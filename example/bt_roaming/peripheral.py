@@ -24,11 +24,14 @@
 #    misrepresented as being the original software.
 # 3. This notice may not be removed or altered from any source distribution.
 
+import concurrent.futures
 import os.path
+import signal
 import sys
 import threading
 import time
 import bgapi
+from bgapi.connector import ConnectorException
 
 sys.path.append(os.path.join(os.path.dirname(__file__), "../.."))
 from common.util import ArgumentParser, BluetoothApp, get_connector
@@ -39,19 +42,42 @@ NOTIFICATION_PERIOD = 10.0
 # Characteristic values
 GATTDB_DEVICE_NAME = b"Heart Rate Sensor"
 GATTDB_MANUFACTURER_NAME_STRING = b"Silicon Labs"
+# 16-bit UUIDs of the services
+UUID_GENERIC_ACCESS = b"\x00\x18"
+UUID_DEVICE_INFORMATION = b"\x0A\x18"
+UUID_HEART_RATE = b"\x0D\x18"
+# 16-bit UUIDs of the characteristics
+UUID_DEVICE_NAME = b"\x00\x2A"
+UUID_APPEARANCE = b"\x01\x2A"
+UUID_MANUFACTURER_NAME_STRING = b"\x29\x2A"
+UUID_SYSTEM_ID = b"\x23\x2A"
+UUID_HEART_RATE_MEASUREMENT = b"\x37\x2A"
 
 class HeartRateSensor(BluetoothApp):
     """ Heart Rate Sensor derived from generic BluetoothApp. """
+    # Sensors with enabled notification, served by a single thread started with the first instance.
+    _notified_sensors = set()
+    _notification_lock = threading.Lock()
+    _notification_thread = None
+    # Notifications to different targets are sent in parallel,
+    # i.e. a slow target doesn't delay the others.
+    _notification_pool = concurrent.futures.ThreadPoolExecutor()
+
     def __init__(self, connector, delete_bondings=False, **kwargs):
         self.delete_bondings = delete_bondings
         self.adv_handle = None
         self.gattdb_heart_rate_measurement = None
-        self.notification_event = threading.Event()
-        self.notification_thread = threading.Thread(target=self.notification_task, daemon=True)
-        self.notification_thread.start()
+        with self._notification_lock:
+            if HeartRateSensor._notification_thread is None:
+                HeartRateSensor._notification_thread = threading.Thread(
+                    target=HeartRateSensor.notification_task,
+                    daemon=True)
+                HeartRateSensor._notification_thread.start()
         super().__init__(connector, **kwargs)
         # Dummy heart rate data derived from instance ID
         self.heart_rate = self.id + 100
+        # The characteristic value consists of 1 byte Flags Field and 1 byte Measurement Value Field
+        self.notification_value = bytes([0, self.heart_rate])
 
     def bt_evt_system_boot(self, evt):
         """ Bluetooth event callback """
@@ -62,7 +88,7 @@ class HeartRateSensor(BluetoothApp):
             if err.errorcode == status.NOT_AVAILABLE:
                 self.log.error("External bonding database feature present in the target firmware.")
             raise
-        self.notification_event.clear()
+        self.notification_disable()
         self.adv_handle = None
         self.gattdb_init()
         if self.delete_bondings:
@@ -78,7 +104,7 @@ class HeartRateSensor(BluetoothApp):
 
     def bt_evt_connection_closed(self, evt):
         """ Bluetooth event callback """
-        self.notification_event.clear()
+        self.notification_disable()
         self.log.info(f"Connection closed with reason {evt.reason:#x}: '{evt.reason}'")
         self.adv_start()
 
@@ -98,107 +124,107 @@ class HeartRateSensor(BluetoothApp):
                 # The remote client requested the status change.
                 if evt.client_config_flags == self.lib.bt.gatt_server.CLIENT_CONFIGURATION_DISABLE:
                     self.log.info("Notification disabled.")
-                    self.notification_event.clear()
-                elif not self.notification_event.is_set():
-                    self.log.info("Notification enabled.")
-                    self.notification_event.set()
+                    self.notification_disable()
+                else:
+                    self.notification_enable()
 
     def gattdb_init(self):
         """ Initialize GATT database. """
-        _, session = self.lib.bt.gattdb.new_session()
+        gattdb = self.lib.bt.gattdb
+        read = gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_READ
+        _, session = gattdb.new_session()
 
         # Generic Access
-        _, service = self.lib.bt.gattdb.add_service(
+        _, service = gattdb.add_service(
             session,
-            self.lib.bt.gattdb.SERVICE_TYPE_PRIMARY_SERVICE,
+            gattdb.SERVICE_TYPE_PRIMARY_SERVICE,
             0,
-            b"\x00\x18"
+            UUID_GENERIC_ACCESS
         )
         # Device Name
-        self.lib.bt.gattdb.add_uuid16_characteristic(
+        gattdb.add_uuid16_characteristic(
             session,
             service,
-            self.lib.bt.gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_READ |
-            self.lib.bt.gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_WRITE,
+            read | gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_WRITE,
             0,
             0,
-            b"\x00\x2A",
-            self.lib.bt.gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
+            UUID_DEVICE_NAME,
+            gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
             len(GATTDB_DEVICE_NAME),
             GATTDB_DEVICE_NAME
         )
         # Appearance
-        self.lib.bt.gattdb.add_uuid16_characteristic(
+        gattdb.add_uuid16_characteristic(
             session,
             service,
-            self.lib.bt.gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_READ,
+            read,
             0,
             0,
-            b"\x01\x2A",
-            self.lib.bt.gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
+            UUID_APPEARANCE,
+            gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
             2,
             b"\x00\x00"
         )
-        self.lib.bt.gattdb.start_service(session, service)
+        gattdb.start_service(session, service)
 
         # Device Information
-        _, service = self.lib.bt.gattdb.add_service(
+        _, service = gattdb.add_service(
             session,
-            self.lib.bt.gattdb.SERVICE_TYPE_PRIMARY_SERVICE,
+            gattdb.SERVICE_TYPE_PRIMARY_SERVICE,
             0,
-            b"\x0A\x18"
+            UUID_DEVICE_INFORMATION
         )
         # Manufacturer Name String
-        self.lib.bt.gattdb.add_uuid16_characteristic(
+        gattdb.add_uuid16_characteristic(
             session,
             service,
-            self.lib.bt.gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_READ,
+            read,
             0,
             0,
-            b"\x29\x2A",
-            self.lib.bt.gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
+            UUID_MANUFACTURER_NAME_STRING,
+            gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
             len(GATTDB_MANUFACTURER_NAME_STRING),
             GATTDB_MANUFACTURER_NAME_STRING
         )
         # System ID
         # Pad and reverse unique ID to get System ID.
-        addr = self.address.split(":")
-        system_id = bytes.fromhex("".join(addr[:3] + ["ff", "fe"] + addr[3:]))
-        self.lib.bt.gattdb.add_uuid16_characteristic(
+        address = bytes.fromhex(self.address.replace(":", ""))
+        system_id = address[:3] + b"\xff\xfe" + address[3:]
+        gattdb.add_uuid16_characteristic(
             session,
             service,
-            self.lib.bt.gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_READ,
+            read,
             0,
             0,
-            b"\x23\x2A",
-            self.lib.bt.gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
+            UUID_SYSTEM_ID,
+            gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
             8,
             system_id
         )
-        self.lib.bt.gattdb.start_service(session, service)
+        gattdb.start_service(session, service)
 
         # Heart Rate Service
-        _, service = self.lib.bt.gattdb.add_service(
+        _, service = gattdb.add_service(
             session,
-            self.lib.bt.gattdb.SERVICE_TYPE_PRIMARY_SERVICE,
-            self.lib.bt.gattdb.SERVICE_PROPERTY_FLAGS_ADVERTISED_SERVICE,
-            b"\x0D\x18"
+            gattdb.SERVICE_TYPE_PRIMARY_SERVICE,
+            gattdb.SERVICE_PROPERTY_FLAGS_ADVERTISED_SERVICE,
+            UUID_HEART_RATE
         )
         # Heart Rate Measurement
-        _, self.gattdb_heart_rate_measurement = self.lib.bt.gattdb.add_uuid16_characteristic(
+        _, self.gattdb_heart_rate_measurement = gattdb.add_uuid16_characteristic(
             session,
             service,
-            self.lib.bt.gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_NOTIFY,
-            self.lib.bt.gattdb.SECURITY_REQUIREMENTS_BONDED_NOTIFY,
+            gattdb.CHARACTERISTIC_PROPERTIES_CHARACTERISTIC_NOTIFY,
+            gattdb.SECURITY_REQUIREMENTS_BONDED_NOTIFY,
             0,
-            b"\x37\x2A",
-            self.lib.bt.gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
+            UUID_HEART_RATE_MEASUREMENT,
+            gattdb.VALUE_TYPE_FIXED_LENGTH_VALUE,
             2,
             b"\x00"*2
         )
-        self.lib.bt.gattdb.start_service(session, service)
+        gattdb.start_service(session, service)
 
-        self.lib.bt.gattdb.commit(session)
+        gattdb.commit(session)
 
     def adv_start(self):
         """ Start advertising. """
@@ -219,24 +245,52 @@ class HeartRateSensor(BluetoothApp):
             self.adv_handle,
             self.lib.bt.legacy_advertiser.CONNECTION_MODE_CONNECTABLE)
 
+    def run(self):
+        """ Main execution loop of the application. """
+        try:
+            super().run()
+        finally:
+            # The connection to the target is closed, notifications can't be sent anymore.
+            self.notification_disable()
+
     def send_notification(self):
         """ Send notification with dummy data. """
         self.log.info("Sending %d BPM", self.heart_rate)
-        # The characteristic value consists of 1 byte Flags Field and 1 byte Measurement Value Field
-        value = bytes([0, self.heart_rate])
-        self.lib.bt.gatt_server.notify_all(self.gattdb_heart_rate_measurement, value)
+        try:
+            self.lib.bt.gatt_server.notify_all(
+                self.gattdb_heart_rate_measurement,
+                self.notification_value)
+        except (bgapi.bglib.CommandError, ConnectorException) as err:
+            # Tolerate command and connector errors, e.g. if the device resets or gets unplugged
+            self.log.error(err)
+            self.notification_disable()
+
+    def notification_enable(self):
+        """ Send notification immediately and then periodically. """
+        with self._notification_lock:
+            if self in self._notified_sensors:
+                return
+            self._notified_sensors.add(self)
+        self.log.info("Notification enabled.")
+        self.send_notification()
 
-    def notification_task(self):
-        """ Indication task executed in its own thread. """
+    def notification_disable(self):
+        """ Stop sending notifications. """
+        with self._notification_lock:
+            self._notified_sensors.discard(self)
+
+    @classmethod
+    def notification_task(cls):
+        """ Notification task executed in its own thread for all sensors. """
+        deadline = time.monotonic()
         while True:
-            self.notification_event.wait()
-            try:
-                self.send_notification()
-            except bgapi.bglib.CommandError as err:
-                # Tolerate command error, e.g. if the device resets
-                self.log.error(err)
-                self.notification_event.clear()
-            time.sleep(NOTIFICATION_PERIOD)
+            # Advance from the deadline rather than from now to avoid drift.
+            deadline += NOTIFICATION_PERIOD
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            with cls._notification_lock:
+                sensors = list(cls._notified_sensors)
+            for sensor in sensors:
+                cls._notification_pool.submit(sensor.send_notification)
 
 def main():
     """ Main function. """
@@ -253,8 +307,14 @@ def main():
         app.start()
     # Catch KeyboardInterrupt
     try:
-        while True:
-            time.sleep(60)
+        if sys.platform == "win32":
+            # The KeyboardInterrupt can interrupt a sleep but not a blocking wait on Windows.
+            while True:
+                time.sleep(60)
+        else:
+            # Sleep until a signal arrives without periodic wakeups.
+            while True:
+                signal.pause()
     except KeyboardInterrupt:
         for app in apps:
             app.stop()
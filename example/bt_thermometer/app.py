@@ -148,8 +148,8 @@ class App(BluetoothApp):
         )
         # System ID
         # Pad and reverse unique ID to get System ID.
-        addr = self.address.split(":")
-        system_id = bytes.fromhex("".join(addr[:3] + ["ff", "fe"] + addr[3:]))
+        address = bytes.fromhex(self.address.replace(":", ""))
+        system_id = address[:3] + b"\xff\xfe" + address[3:]
         self.lib.bt.gattdb.add_uuid16_characteristic(
             session,
             service,
@@ -62,6 +62,13 @@ class Connection:
 
 class App(BluetoothApp):
     """ Application derived from generic BluetoothApp. """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Advertisements of interest are both connectable and scannable
+        self.scan_flags = (
+            self.lib.bt.scanner.EVENT_FLAG_EVENT_FLAG_CONNECTABLE |
+            self.lib.bt.scanner.EVENT_FLAG_EVENT_FLAG_SCANNABLE)
+
     def bt_evt_system_boot(self, evt):
         """ Bluetooth event callback
 
@@ -82,13 +89,12 @@ class App(BluetoothApp):
             self.lib.bt.scanner.DISCOVER_MODE_DISCOVER_GENERIC)
         self.log.info("Scanning started...")
         self.conn_state = "scanning"
-        self.connections = dict[int, Connection]()
+        self.connections: dict[int, Connection] = {}
 
     def bt_evt_scanner_legacy_advertisement_report(self, evt):
         """ Bluetooth event callback """
         # Parse advertisement packets
-        if (evt.event_flags & self.lib.bt.scanner.EVENT_FLAG_EVENT_FLAG_CONNECTABLE and
-            evt.event_flags & self.lib.bt.scanner.EVENT_FLAG_EVENT_FLAG_SCANNABLE):
+        if evt.event_flags & self.scan_flags == self.scan_flags:
             # If a thermometer advertisement is found...
             if find_service_in_advertisement(evt.data, HEALTH_THERMOMETER_SERVICE):
                 # then stop scanning for a while